@@ -1,45 +1,63 @@
 #!/bin/python3
 
 from sys import argv
-from os import listdir
+from os import cpu_count, listdir
 from os.path import isfile, join
+from concurrent.futures import ProcessPoolExecutor
 import json
 
 from web3 import Web3
 from eth_keys import keys
 
 
-if len(argv) < 2:
-    print("please specify keystore path.")
-    exit(-1)
+def decrypt_one(args):
+    # each worker builds its own Web3 instance; scrypt runs in C and
+    # dominates, so the per-process setup cost is negligible
+    encrypted_key, passphrase = args
+    w3 = Web3()
+    private_key_bytes = w3.eth.account.decrypt(encrypted_key, passphrase)
+    private_key = keys.PrivateKey(private_key_bytes)
+    public_key = private_key.public_key
+    return {
+        "address": public_key.to_address(),
+        "passphrase": passphrase,
+        "public_key": public_key.to_hex(),
+        "private_key": private_key.to_hex()
+    }
+
+
+def main():
+    if len(argv) < 2:
+        print("please specify keystore path.")
+        exit(-1)
+
+    # find all files
+    keystore_path = argv[1]
+    files = [join(keystore_path, f) for f in listdir(keystore_path)
+             if isfile(join(keystore_path, f))]
+    files.sort()
+
+    # read everything up front (cheap next to scrypt), then run the
+    # decryptions across all cores; map() preserves the file order
+    passphrases = [c*4 for c in "123456789a"]
+    if len(files) > len(passphrases):
+        # zip would silently drop the extra keystores and produce an
+        # incomplete allkeys.json
+        raise IndexError("only {} passphrases for {} keystore files".format(
+            len(passphrases), len(files)))
+    contents = []
+    for f in files:
+        print("unloking {}".format(f))
+        with open(f) as fh:
+            contents.append(fh.read())
+    with ProcessPoolExecutor(max_workers=cpu_count()) as executor:
+        allkeys = list(executor.map(
+            decrypt_one, zip(contents, passphrases)))
 
-# get w3 instance
-w3 = Web3()
+    # write out result
+    with open("allkeys.json", "w") as fh:
+        json.dump(allkeys, fh, indent=2, ensure_ascii=False)
 
-# find all files
-keystore_path = argv[1]
-files = [join(keystore_path, f) for f in listdir(keystore_path)
-         if isfile(join(keystore_path, f))]
-files.sort()
 
-# convert to pubkey
-passphrases = [c*4 for c in "123456789a"]
-allkeys = []
-for i, f in enumerate(files):
-    with open(f) as fh:
-        print("unloking {}".format(f))
-        encrypted_key = fh.read()
-        private_key_bytes = w3.eth.account.decrypt(
-            encrypted_key, passphrases[i])
-        private_key = keys.PrivateKey(private_key_bytes)
-        public_key = private_key.public_key
-        allkeys.append({
-            "address": public_key.to_address(),
-            "passphrase": passphrases[i],
-            "public_key": public_key.to_hex(),
-            "private_key": private_key.to_hex()
-        })
-
-# write out result
-with open("allkeys.json", "w") as fh:
-    json.dump(allkeys, fh, indent=2, ensure_ascii=False)
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ extern crate bellman;
 extern crate ff;
 extern crate pairing;
 extern crate rand;
+extern crate rayon;
 extern crate sapling_crypto;
 
 pub mod zk;
@@ -11,6 +12,7 @@ use std::sync::Once;
 use std::slice;
 
 use bellman::groth16;
+use rayon::prelude::*;
 use ff::{BitIterator, PrimeField, PrimeFieldRepr, Field, ScalarEngine};
 use pairing::bls12_381::{Bls12, Fr};
 use sapling_crypto::jubjub::JubjubBls12;
@@ -41,23 +43,16 @@ fn get_bls_params() -> &'static JubjubBls12 {
     }
 }
 
-#[no_mangle]
-pub unsafe extern "C" fn _jubjub_hash(
-    personalization: c_int, // -1 for commitment, >= 0 for merkle tree
-    fr_ptr_a: *const u8,
-    fr_ptr_b: *const u8,
-    out_ptr: *mut u8,
-) {
-    let fr_a = read_field_from_c_ptr(fr_ptr_a);
-    let fr_b = read_field_from_c_ptr(fr_ptr_b);
-    fn fr_to_bits_le(x: Fr) -> Vec<bool> {
-        BitIterator::new(x.into_repr())
-            .collect::<Vec<bool>>()
-            .into_iter()
-            .rev()
-            .take(Fr::NUM_BITS as usize)
-            .collect()
-    }
+fn fr_to_bits_le(x: Fr) -> Vec<bool> {
+    BitIterator::new(x.into_repr())
+        .collect::<Vec<bool>>()
+        .into_iter()
+        .rev()
+        .take(Fr::NUM_BITS as usize)
+        .collect()
+}
+
+fn jubjub_hash_one(personalization: c_int, fr_a: Fr, fr_b: Fr) -> Fr {
     let preimage: Vec<bool> = fr_to_bits_le(fr_a)
         .into_iter()
         .chain(fr_to_bits_le(fr_b).into_iter())
@@ -67,12 +62,47 @@ pub unsafe extern "C" fn _jubjub_hash(
         x => pedersen_hash::Personalization::MerkleTree(x as usize),
     };
 
-    let fr_out = pedersen_hash::pedersen_hash::<Bls12, _>(personalization, preimage, get_bls_params())
+    pedersen_hash::pedersen_hash::<Bls12, _>(personalization, preimage, get_bls_params())
         .into_xy()
-        .0;
+        .0
+}
+
+#[no_mangle]
+pub unsafe extern "C" fn _jubjub_hash(
+    personalization: c_int, // -1 for commitment, >= 0 for merkle tree
+    fr_ptr_a: *const u8,
+    fr_ptr_b: *const u8,
+    out_ptr: *mut u8,
+) {
+    let fr_a = read_field_from_c_ptr(fr_ptr_a);
+    let fr_b = read_field_from_c_ptr(fr_ptr_b);
+    let fr_out = jubjub_hash_one(personalization, fr_a, fr_b);
     write_field_to_c_ptr(&fr_out, out_ptr);
 }
 
+#[no_mangle]
+pub unsafe extern "C" fn _jubjub_hash_batch(
+    personalization: c_int, // -1 for commitment, >= 0 for merkle tree
+    in_ptr: *const u8,      // n_pairs consecutive (left, right) pairs
+    n_pairs: usize,
+    out_ptr: *mut u8, // n_pairs consecutive digests
+) {
+    // the pairs are independent, so hash them across all cores; the
+    // contiguous stride-64 input keeps each worker streaming through
+    // its own cache lines
+    let input = slice::from_raw_parts(in_ptr, n_pairs * 2 * zk::HASH_SIZE);
+    let output = slice::from_raw_parts_mut(out_ptr, n_pairs * zk::HASH_SIZE);
+    input
+        .par_chunks(2 * zk::HASH_SIZE)
+        .zip(output.par_chunks_mut(zk::HASH_SIZE))
+        .for_each(|(pair, out)| {
+            let fr_a = read_field_from_c_ptr(pair.as_ptr());
+            let fr_b = read_field_from_c_ptr(pair[zk::HASH_SIZE..].as_ptr());
+            let fr_out = jubjub_hash_one(personalization, fr_a, fr_b);
+            write_field_to_c_ptr(&fr_out, out.as_mut_ptr());
+        });
+}
+
 #[no_mangle]
 pub unsafe extern "C" fn _generate_pre_transfer_proof(
     commit_root: *const u8,
@@ -1,9 +1,16 @@
 #pragma once
 
+#include <stddef.h>
+
 void _jubjub_hash(
     int personalization, // -1 for commitment, >= 0 for merkle tree
     const char *fr_ptr_a, const char *fr_ptr_b, const char *out_ptr);
 
+void _jubjub_hash_batch(
+    int personalization,    // -1 for commitment, >= 0 for merkle tree
+    const char *in_ptr,     // n_pairs consecutive (left, right) pairs
+    size_t n_pairs, const char *out_ptr);
+
 int _verify_pre_transfer_proof(const char *commit_root,
                                const char *commit_root_t,
                                const char *address_new, const char *nonce,
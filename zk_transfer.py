@@ -1,9 +1,20 @@
-from functools import reduce
-from operator import add
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, reduce
 import random
 from os import urandom
 from hashlib import sha256
-from ctypes import (cdll, create_string_buffer, c_int, c_void_p, addressof)
+from ctypes import (cdll, create_string_buffer, c_char, c_char_p, c_int,
+                    c_size_t, c_void_p, addressof, memset)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
 
 import web3
 from web3 import Web3
@@ -13,6 +24,9 @@ from ecies import encrypt, decrypt
 from ecies.utils import generate_eth_key, keys
 
 
+_ZEROS = b'\x00'*HASH_BYTES
+
+
 def timing(f):
     from functools import wraps
     from time import time
@@ -28,9 +42,38 @@ def timing(f):
     return wrap
 
 
+if numba is not None:
+    @numba.njit(cache=True)
+    def _merkle_proof_indices(index, depth):
+        """ per-level direction bits and sibling indexes for a leaf """
+        directions = np.empty(depth, np.int64)
+        siblings = np.empty(depth, np.int64)
+        for l in range(depth):
+            level_index = index >> l
+            d = level_index & 0x1
+            directions[l] = d
+            siblings[l] = level_index - 1 if d == 1 else level_index + 1
+        return directions, siblings
+else:
+    def _merkle_proof_indices(index, depth):
+        """ per-level direction bits and sibling indexes for a leaf """
+        directions, siblings = [], []
+        for l in range(depth):
+            level_index = index >> l
+            d = level_index & 0x1
+            directions.append(d)
+            siblings.append(level_index - 1 if d == 1 else level_index + 1)
+        return directions, siblings
+
+
 class ZkTransfer:
     # Provides jubjubhash ans zk-related functions
     librustzk = cdll.LoadLibrary("librustzk.so")
+    try:
+        _jubjub_hash_batch = librustzk._jubjub_hash_batch
+    except AttributeError:
+        # prebuilt librustzk.so without the batch entry point
+        _jubjub_hash_batch = None
 
     def __init__(self, contract_addr, contract_abi, w3, addr2key, zk_params_dir, skip_zk=False):
         self.skip_zk = skip_zk
@@ -42,13 +85,22 @@ class ZkTransfer:
         # load zk-related keys
         self.load_zk_keys(zk_params_dir)
 
+        # one reusable output buffer per proof type, zeroed before each
+        # call, instead of a fresh PROOF_BUF_LEN allocation per proof
+        self._proof_bufs = {
+            name: create_string_buffer(PROOF_BUF_LEN)
+            for name in ('pre_transfer', 'preparation', 'transfer')}
+
     @staticmethod
     def _sha256checksum(filename):
         import hashlib
-        sha256_hash = hashlib.sha256()
         with open(filename, "rb") as f:
-            # Read and update hash string value in blocks of 4K
-            for byte_block in iter(lambda: f.read(4096), b""):
+            if hasattr(hashlib, "file_digest"):  # Python 3.11+
+                return hashlib.file_digest(f, "sha256").hexdigest()
+            # fall back to a chunked loop; 1 MiB blocks amortize the
+            # Python-level call overhead into OpenSSL
+            sha256_hash = hashlib.sha256()
+            for byte_block in iter(lambda: f.read(1 << 20), b""):
                 sha256_hash.update(byte_block)
         return sha256_hash.hexdigest()
 
@@ -67,7 +119,9 @@ class ZkTransfer:
     def _pad_bytes(data, length=HASH_BYTES, prepend=False):
         if len(data) > length:
             raise Exception("data overflows bytes{}".format(length))
-        padding = b'\x00'*(length-len(data))
+        # slicing the precomputed buffer beats bytes.__mul__ per call
+        padding = _ZEROS[len(data):] if length == HASH_BYTES \
+            else b'\x00'*(length-len(data))
         return data+padding if not prepend else padding+data
 
     @staticmethod
@@ -80,21 +134,59 @@ class ZkTransfer:
 
     @staticmethod
     def _pad_hexstr(data):
-        return ZkTransfer._pad_bytes(Web3.toBytes(hexstr=data))
+        hexstr = data[2:] if data.startswith('0x') else data
+        if len(hexstr) % 2:  # match Web3.toBytes on odd-length input
+            hexstr = '0' + hexstr
+        return ZkTransfer._pad_bytes(bytes.fromhex(hexstr))
 
     @staticmethod
-    def _to_cbuf(data):
-        buffer = create_string_buffer(len(data))
-        buffer.raw = data
-        return buffer
+    def _pack_addresses(addrs):
+        """ hex-decode @addrs into one flat buffer of 32-byte slots;
+        bytes 20..32 of each slot stay zero, matching _pad_hexstr """
+        buf = bytearray(len(addrs)*HASH_BYTES)
+        for i, a in enumerate(addrs):
+            raw = bytes.fromhex(a[2:] if a.startswith('0x') else a)
+            buf[i*HASH_BYTES:i*HASH_BYTES+len(raw)] = raw
+        return bytes(buf)
 
     @staticmethod
     def _jubjubhash(x, y, t):
-        buffer_x, buffer_y = ZkTransfer._to_cbuf(x), ZkTransfer._to_cbuf(y)
+        # the FFI only reads x/y, so c_char_p views of the immutable
+        # bytes replace the old per-argument buffer copies
         out = create_string_buffer(HASH_BYTES)
-        ZkTransfer.librustzk._jubjub_hash(c_int(t), buffer_x, buffer_y, out)
+        ZkTransfer.librustzk._jubjub_hash(
+            c_int(t), c_char_p(x), c_char_p(y), out)
+        return out.raw
+
+    @staticmethod
+    def _jubjubhash_level(level_bytes, t):
+        """ hash a whole merkle level (consecutive 64-byte pairs) in one
+        FFI call; returns the concatenated 32-byte digests """
+        n_pairs = len(level_bytes) // (2*HASH_BYTES)
+        if ZkTransfer._jubjub_hash_batch is None:
+            # old librustzk.so: fall back to one FFI call per pair
+            return b"".join(
+                ZkTransfer._jubjubhash(
+                    level_bytes[2*i*HASH_BYTES:(2*i+1)*HASH_BYTES],
+                    level_bytes[(2*i+1)*HASH_BYTES:(2*i+2)*HASH_BYTES], t)
+                for i in range(n_pairs))
+        out = create_string_buffer(n_pairs*HASH_BYTES)
+        ZkTransfer._jubjub_hash_batch(
+            c_int(t), c_char_p(bytes(level_bytes)), c_size_t(n_pairs), out)
         return out.raw
 
+    @staticmethod
+    def _jubjubhash_level_into(level, t, out):
+        """ hash a merkle level straight from its backing bytearray into
+        @out's, with no intermediate bytes objects """
+        if ZkTransfer._jubjub_hash_batch is None:
+            out[:] = ZkTransfer._jubjubhash_level(bytes(level), t)
+            return
+        ZkTransfer._jubjub_hash_batch(
+            c_int(t), (c_char*len(level)).from_buffer(level),
+            c_size_t(len(level)//(2*HASH_BYTES)),
+            (c_char*len(out)).from_buffer(out))
+
     @staticmethod
     def _accumulate_hash(*args, t=-1):
         if not all(map(lambda x: isinstance(x, bytes) and len(x) == 32, args)):
@@ -102,81 +194,150 @@ class ZkTransfer:
         return reduce(lambda x, y:  ZkTransfer._jubjubhash(x, y, t), args)
 
     def _get_nonce(self):
-        return urandom(NONCE_BYTES-1)+b'\x00'  # fit the bls12-381 Fr
+        nonce = bytearray(NONCE_BYTES)  # trailing zero fits the bls12-381 Fr
+        nonce[:NONCE_BYTES-1] = urandom(NONCE_BYTES-1)
+        return bytes(nonce)
 
     @staticmethod
-    def _extend_friends(_friends, passphrase, threshold, nonce):
-        friends_len = len(_friends)
-
-        # check length/format and normalize
-        if friends_len > MAX_FRIENDS_LEN:
+    @lru_cache(maxsize=128)
+    def _canonicalize_friends(_friends):
+        """ validate @_friends (a tuple) and return it sorted and
+        checksummed; cached so a repeated list skips the per-address
+        keccak inside toChecksumAddress """
+        if len(_friends) > MAX_FRIENDS_LEN:
             raise Exception("friends list too long")
         if not all(map(Web3.isAddress, _friends)):
             raise Exception("invalid address")
-        friends = sorted(list(map(Web3.toChecksumAddress, _friends)))
+        return tuple(sorted(map(Web3.toChecksumAddress, _friends)))
 
-        # init seed with friends[0]+...+frinds[n-1]+pass+threshold+nonce
-        friends_bytes = [Web3.toBytes(hexstr=f) for f in friends]
-        seed = sha256(reduce(add, friends_bytes) +
-                      passphrase + threshold + nonce).digest()
-        random.seed(seed)
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _seed_hash_midstate(friends, passphrase, threshold):
+        """ sha256 state with friends[0]+...+friends[n-1]+pass+threshold
+        already absorbed; per-nonce seeds then only hash the tail """
+        h = sha256()
+        for f in friends:
+            h.update(Web3.toBytes(hexstr=f))
+        h.update(passphrase)
+        h.update(threshold)
+        return h
 
-        # genereate random indexes
+    @staticmethod
+    def _extend_friends(_friends, passphrase, threshold, nonce):
+        # check length/format and normalize (cached per input tuple)
+        friends = ZkTransfer._canonicalize_friends(tuple(_friends))
+        friends_len = len(friends)
+
+        # init seed with friends[0]+...+frinds[n-1]+pass+threshold+nonce;
+        # the fixed prefix is absorbed once and copied, so only the
+        # nonce and padding blocks get compressed per call
+        h = ZkTransfer._seed_hash_midstate(
+            friends, passphrase, threshold).copy()
+        h.update(nonce)
+        random.seed(h.digest())
+
+        # genereate random indexes; the seen-set keeps the exact same
+        # sequence of randrange draws (so existing commits still
+        # re-derive the same layout) while making the membership test
+        # O(1) instead of a list scan
         indexes = []
+        seen = set()
         while len(indexes) < friends_len:
             r = random.randrange(0, MAX_FRIENDS_LEN-1)
-            while r in indexes:
-                r = random.randrange(0, MAX_FRIENDS_LEN-1)
-            indexes.append(r)
+            if r not in seen:
+                seen.add(r)
+                indexes.append(r)
 
         result = [NULL_ADDRESS]*MAX_FRIENDS_LEN
         for i, r in enumerate(indexes):
             result[r] = friends[i]
         return result
 
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _extended_friend_lookup(extended_friends):
+        """ index of every address plus the NULL_ADDRESS slots in order """
+        addr_to_idx = {a: i for i, a in enumerate(extended_friends)}
+        null_slots = tuple(i for i, a in enumerate(extended_friends)
+                           if a == NULL_ADDRESS)
+        return addr_to_idx, null_slots
+
     @staticmethod
     def _get_extended_friend_index(extended_friends, friends, friend_index):
+        addr_to_idx, null_slots = ZkTransfer._extended_friend_lookup(
+            tuple(extended_friends))
         if friend_index < len(friends):
-            return extended_friends.index(Web3.toChecksumAddress(friends[friend_index]))
+            return addr_to_idx[Web3.toChecksumAddress(friends[friend_index])]
+        return null_slots[friend_index-len(friends)]
 
-        friend_index -= len(friends)
-        for i, f in enumerate(extended_friends):
-            if f != NULL_ADDRESS:
-                continue
-            if friend_index == 0:
-                return i
-            friend_index -= 1
+    # upper tree levels keyed by the serialized middle layer: when two
+    # builds agree at depth _MERKLE_TOP_LAYER the whole top subtree is
+    # identical, so reuse it instead of rehashing 2^L-1 nodes (the proof
+    # depth itself is fixed by the zk circuit and stays unchanged)
+    _MERKLE_TOP_LAYER = FRIENDS_MERKLE_DEPTH // 2
+    _top_levels_cache = {}
 
     @staticmethod
     def _build_friends_merkle_tree(extended_friends):
         """ construct a merkle tree from a list of addresses """
-        tree = [[] for _ in range(FRIENDS_MERKLE_DEPTH+1)]
-        addr_bytes = list(map(ZkTransfer._pad_hexstr, extended_friends))
-        tree[FRIENDS_MERKLE_DEPTH] = addr_bytes
+        # every level is one contiguous buffer of 32-byte nodes; the
+        # batch FFI reads the child buffer and writes the parent in
+        # place, so no per-node bytes objects are built
+        tree = [bytearray((1 << l)*HASH_BYTES)
+                for l in range(FRIENDS_MERKLE_DEPTH)]
+        # one decode pass into a flat buffer instead of a Web3.toBytes
+        # call and a fresh padded object per address
+        tree.append(bytearray(ZkTransfer._pack_addresses(extended_friends)))
+        top = ZkTransfer._MERKLE_TOP_LAYER
+        cache = ZkTransfer._top_levels_cache
         for l in range(FRIENDS_MERKLE_DEPTH-1, -1, -1):
-            for i in range(len(tree[l+1])//2):
-                tree[l].append(ZkTransfer._accumulate_hash(
-                    tree[l+1][2*i], tree[l+1][2*i+1], t=FRIENDS_MERKLE_DEPTH-1-l))
+            # one FFI crossing per level instead of one per pair
+            ZkTransfer._jubjubhash_level_into(
+                tree[l+1], FRIENDS_MERKLE_DEPTH-1-l, tree[l])
+            if l == top:
+                cached = cache.get(bytes(tree[l]))
+                if cached is not None:
+                    tree[:l] = cached
+                    return tree
+        if len(cache) >= 64:
+            cache.clear()
+        cache[bytes(tree[top])] = [bytes(lvl) for lvl in tree[:top]]
         return tree
 
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _extend_and_build_tree(friends, passphrase, threshold, nonce):
+        """ memoized extension + merkle tree for one commit
+
+        The pre-transfer, preparation and transfer paths all rebuild the
+        same tree from the same inputs; cache it so only the first call
+        pays the 2^FRIENDS_MERKLE_DEPTH jubjub hashes. @friends must be
+        a tuple so the key is hashable.
+        """
+        extended_friends = tuple(ZkTransfer._extend_friends(
+            friends, passphrase, threshold, nonce))
+        tree = ZkTransfer._build_friends_merkle_tree(extended_friends)
+        return extended_friends, tree
+
     @staticmethod
     def _calc_friends_merkle_root(extended_friends):
         """compute the merkle root of a list of friend's addresses"""
-        return ZkTransfer._build_friends_merkle_tree(extended_friends)[0][0]
+        return bytes(ZkTransfer._build_friends_merkle_tree(extended_friends)[0])
 
     @staticmethod
-    def _get_friend_merkle_proof(extended_friends, index):
-        tree = ZkTransfer._build_friends_merkle_tree(extended_friends)
-        friend = tree[FRIENDS_MERKLE_DEPTH][index]
-        path, directions = [], []
-        for l in range(0, FRIENDS_MERKLE_DEPTH):
-            level_index = index >> l
-            curr_level = FRIENDS_MERKLE_DEPTH-l
-            directions.append(level_index & 0x1)
-            path.append(tree[curr_level][level_index-1] if directions[-1]
-                        == 1 else tree[curr_level][level_index+1])
+    def _tree_node(tree, level, index):
+        """ the @index-th 32-byte node of a packed tree level """
+        return bytes(tree[level][index*HASH_BYTES:(index+1)*HASH_BYTES])
+
+    @staticmethod
+    def _get_friend_merkle_proof(tree, index):
+        friend = ZkTransfer._tree_node(tree, FRIENDS_MERKLE_DEPTH, index)
+        dirs, siblings = _merkle_proof_indices(index, FRIENDS_MERKLE_DEPTH)
+        directions = [int(d) for d in dirs]
+        path = [ZkTransfer._tree_node(tree, FRIENDS_MERKLE_DEPTH-l, siblings[l])
+                for l in range(FRIENDS_MERKLE_DEPTH)]
         return {
-            "root": tree[0][0],
+            "root": bytes(tree[0]),
             "directions": directions,
             "path": path,
             "friend": friend,
@@ -203,9 +364,9 @@ class ZkTransfer:
         threshold = self._pad_int(_threshold)
         passphrase = self._pad_str(_passphrase)
         nonce = self._get_nonce()
-        extended_friends = ZkTransfer._extend_friends(
-            friends, passphrase, threshold, nonce)
-        addr_root = self._calc_friends_merkle_root(extended_friends)
+        _, tree = self._extend_and_build_tree(
+            self._canonicalize_friends(tuple(friends)), passphrase, threshold, nonce)
+        addr_root = bytes(tree[0])
         commit_root = self._accumulate_hash(
             addr_root, passphrase, threshold, nonce)
 
@@ -243,29 +404,52 @@ class ZkTransfer:
 
     @staticmethod
     def _generate_random_str(length):
-        return ''.join([chr(b % 128) for b in urandom(length)])
+        if np is not None:
+            # C-vectorized masking; & 0x7f == % 128 for uint8
+            return (np.frombuffer(urandom(length), np.uint8)
+                    & 0x7f).tobytes().decode('ascii')
+        return bytes(b & 0x7f for b in urandom(length)).decode('ascii')
 
     @staticmethod
     def _bytes_list_to_carray(bytes_list):
-        cbufs = list(map(ZkTransfer._to_cbuf, bytes_list))
-        arr = (c_void_p * len(bytes_list))(*map(addressof, cbufs))
-        # return the bufs keep the refcnt, so that they don't get free'ed
-        return arr, cbufs
+        # pack the elements into one contiguous buffer and point the
+        # pointer array at fixed offsets into it: the Rust side then
+        # streams a stride-32 array instead of chasing scattered
+        # objects, and only one allocation is made
+        elem_size = len(bytes_list[0]) if bytes_list else 0
+        buf = create_string_buffer(b"".join(bytes_list))
+        base = addressof(buf)
+        arr = (c_void_p * len(bytes_list))(
+            *(base + i*elem_size for i in range(len(bytes_list))))
+        # return the buf to keep the refcnt, so that it doesn't get
+        # free'ed
+        return arr, buf
+
+    @staticmethod
+    def _buffer_to_carray(buf, elem_size=HASH_BYTES):
+        # pointer array straight into an already-contiguous level
+        # buffer: the FFI reads the tree's own storage, no join/copy
+        view = (c_char*len(buf)).from_buffer(buf)
+        base = addressof(view)
+        n = len(buf)//elem_size
+        arr = (c_void_p * n)(*(base + i*elem_size for i in range(n)))
+        return arr, view
 
     @timing
     def _get_pre_transfer_proof(self, commit_root, commit_root_t, addrs_padded,
                                 passphrase, threshold, addr_new_padded, nonce):
-        out = create_string_buffer(PROOF_BUF_LEN)
-        arr, bufs = self._bytes_list_to_carray(addrs_padded)
+        out = self._proof_bufs['pre_transfer']
+        memset(out, 0, PROOF_BUF_LEN)
+        arr, bufs = self._buffer_to_carray(addrs_padded)
         self.librustzk._generate_pre_transfer_proof(
-            self._to_cbuf(commit_root),
-            self._to_cbuf(commit_root_t),
+            c_char_p(commit_root),
+            c_char_p(commit_root_t),
             arr,
-            self._to_cbuf(passphrase),
-            self._to_cbuf(threshold),
-            self._to_cbuf(addr_new_padded),
-            self._to_cbuf(nonce),
-            self._to_cbuf(self.pre_transfer_params),
+            c_char_p(passphrase),
+            c_char_p(threshold),
+            c_char_p(addr_new_padded),
+            c_char_p(nonce),
+            c_char_p(self.pre_transfer_params),
             c_int(len(self.pre_transfer_params)),
             out, c_int(PROOF_BUF_LEN))
         return out.raw
@@ -290,16 +474,16 @@ class ZkTransfer:
         # construct commit_root_t
         commit = self.get_commit_tx(commit_index)
         commit_root, commit_nonce = commit["commit_root"], commit["nonce"]
-        extended_friends = self._extend_friends(
-            friends, passphrase, threshold, commit_nonce)
-        addrs_root = self._calc_friends_merkle_root(extended_friends)
+        extended_friends, tree = self._extend_and_build_tree(
+            self._canonicalize_friends(tuple(friends)), passphrase, threshold, commit_nonce)
+        addrs_root = bytes(tree[0])
         addr_padded = self._pad_hexstr(addr)
         commit_root_t = self._accumulate_hash(
             addrs_root, passphrase, threshold, addr_padded)
 
-        # construct pre_transfer_proof
-        extended_friends_padded = [
-            self._pad_hexstr(f) for f in extended_friends]
+        # construct pre_transfer_proof; the tree leaves already hold the
+        # padded addresses
+        extended_friends_padded = tree[FRIENDS_MERKLE_DEPTH]
         print("generating pre_transfer_proof...")
         pre_transfer_proof = self._get_pre_transfer_proof(
             commit_root, commit_root_t, extended_friends_padded,
@@ -312,9 +496,11 @@ class ZkTransfer:
         if pubkeys_len > MAX_FRIENDS_LEN or notes_len > MAX_FRIENDS_LEN or pubkeys_len != notes_len:
             raise Exception("invalid friend_pubkeys length or notes length")
 
-        # generate, pad and shuffle invitaions
-        invitations = [self._calc_invitation(pk, addr, note)
-                       for pk, addr, note in zip(friend_pubkeys, friends, notes)]
+        # generate, pad and shuffle invitaions; the ECIES C backend
+        # releases the GIL, so the per-friend encryptions run in parallel
+        with ThreadPoolExecutor(max_workers=MAX_FRIENDS_LEN) as executor:
+            invitations = list(executor.map(
+                self._calc_invitation, friend_pubkeys, friends, notes))
         invitation_len = len(invitations[0])
         invitations.extend(urandom(invitation_len)
                            for _ in range(MAX_FRIENDS_LEN-pubkeys_len))
@@ -371,6 +557,32 @@ class ZkTransfer:
         Returns:
             receipt of the transaction
         """
+        tx_hash = self._submit_verification_tx(
+            pre_transfer_index, account_index)
+        tx_receipt = self.w3.eth.waitForTransactionReceipt(tx_hash)
+        return tx_receipt
+
+    def send_verification_txs(self, pre_transfer_index, account_indexes):
+        """ send verification txs for several friends at once
+
+        All txs are submitted before waiting on any receipt, so N friends
+        pay roughly one confirmation round-trip instead of N.
+
+        Args:
+            pre_transfer_index [int]: index of the pre-transfer tx
+            account_indexes [int[]]: the friend accounts to verify with
+
+        Returns:
+            list of receipts, in the same order as account_indexes
+        """
+        tx_hashes = [self._submit_verification_tx(pre_transfer_index, index)
+                     for index in account_indexes]
+        return [self.w3.eth.waitForTransactionReceipt(tx_hash)
+                for tx_hash in tx_hashes]
+
+    def _submit_verification_tx(self, pre_transfer_index, account_index=0):
+        """ construct and submit a verification tx without waiting for
+        its receipt; returns the tx hash """
         my_addr = self.w3.eth.accounts[account_index]
         self.w3.eth.defaultAccount = my_addr
 
@@ -395,13 +607,11 @@ class ZkTransfer:
         verification_receipt = encrypt(
             pk_new, pre_transfer_index_padded+nonce1)
 
-        tx_hash = self.contract.functions.verification_tx(
+        return self.contract.functions.verification_tx(
             verification,
             pre_transfer_commitment,
             nonce2,
             verification_receipt).transact()
-        tx_receipt = self.w3.eth.waitForTransactionReceipt(tx_hash)
-        return tx_receipt
 
     def get_verification_tx(self, index):
         raw = self.contract.functions.verifications(index).call()
@@ -448,6 +658,9 @@ class ZkTransfer:
 
     @staticmethod
     def _bits_to_bytes(bits):
+        if np is not None:
+            # C-level MSB-first packing, same layout as the loop below
+            return np.packbits(np.asarray(bits, dtype=np.uint8)).tobytes()
         res = []
         i = 0
         while i < len(bits):
@@ -471,26 +684,27 @@ class ZkTransfer:
         assert(len(friend_d) == FRIENDS_MERKLE_DEPTH)
         assert(len(verification_d) == VERIFICATION_MERKLE_DEPTH)
 
-        out = create_string_buffer(PROOF_BUF_LEN)
+        out = self._proof_bufs['preparation']
+        memset(out, 0, PROOF_BUF_LEN)
         friend_path_array, fpath_bufs = self._bytes_list_to_carray(friend_path)
         verification_path_array, vpath_bufs = self._bytes_list_to_carray(
             verification_path)
         self.librustzk._generate_preparation_proof(
-            self._to_cbuf(commit_root),
-            self._to_cbuf(friend_addr),
+            c_char_p(commit_root),
+            c_char_p(friend_addr),
             friend_path_array,
-            self._to_cbuf(bytes(friend_d)),
-            self._to_cbuf(passphrase),
-            self._to_cbuf(threshold),
-            self._to_cbuf(nonce),
-            self._to_cbuf(verification),
-            self._to_cbuf(pre_transfer_index),
-            self._to_cbuf(verification_nonce1),
-            self._to_cbuf(verification_nonce2),
-            self._to_cbuf(verification_root),
+            c_char_p(bytes(friend_d)),
+            c_char_p(passphrase),
+            c_char_p(threshold),
+            c_char_p(nonce),
+            c_char_p(verification),
+            c_char_p(pre_transfer_index),
+            c_char_p(verification_nonce1),
+            c_char_p(verification_nonce2),
+            c_char_p(verification_root),
             verification_path_array,
-            self._to_cbuf(bytes(verification_d)),
-            self._to_cbuf(self.preparation_params),
+            c_char_p(bytes(verification_d)),
+            c_char_p(self.preparation_params),
             c_int(len(self.preparation_params)),
             out, c_int(PROOF_BUF_LEN)
         )
@@ -517,18 +731,33 @@ class ZkTransfer:
         passphrase = self._pad_str(_passphrase)
         threshold = self._pad_int(_threshold)
 
-        # get commit root and nonce
-        pre_transfer = self.get_pre_transfer_tx(pre_transfer_index)
-        commit = self.get_commit_tx(pre_transfer["commit_index"])
+        # issue the independent contract reads concurrently so their RPC
+        # round trips overlap (HTTPProvider is thread-safe)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            pre_transfer_f = executor.submit(
+                self.get_pre_transfer_tx, pre_transfer_index)
+            if friend_index < len(friends):
+                verification_proof_f = executor.submit(
+                    self.get_verification_path_proof, verification_index)
+                verification_tx_f = executor.submit(
+                    self.get_verification_tx, verification_index)
+            else:
+                verification_proof_f = executor.submit(
+                    self.get_verification_path_proof, 0)
+                verification_tx_f = None
+
+            # get commit root and nonce
+            pre_transfer = pre_transfer_f.result()
+            commit = self.get_commit_tx(pre_transfer["commit_index"])
         commit_root, commit_nonce = commit["commit_root"], commit["nonce"]
 
         # get friend's merkle proof
-        extended_friends = self._extend_friends(
-            friends, passphrase, threshold, commit_nonce)
+        extended_friends, tree = self._extend_and_build_tree(
+            self._canonicalize_friends(tuple(friends)), passphrase, threshold, commit_nonce)
         extended_friend_index = self._get_extended_friend_index(
             extended_friends, friends, friend_index)
         friend_proof = self._get_friend_merkle_proof(
-            extended_friends, extended_friend_index)
+            tree, extended_friend_index)
 
         # get verification nonce and merkle proof
         if friend_index < len(friends):
@@ -537,14 +766,12 @@ class ZkTransfer:
                 verification_receipt, account_index)
             if _pre_transfer_index != pre_transfer_index:
                 raise Exception("Invalid verification")
-            verification_proof = self.get_verification_path_proof(
-                verification_index)
-            verification_nonce2 = self.get_verification_tx(verification_index)[
-                "nonce"]
+            verification_proof = verification_proof_f.result()
+            verification_nonce2 = verification_tx_f.result()["nonce"]
         else:
             # generate fake nonce and just take the first verification proof
             verification_nonce1, verification_nonce2 = self._get_nonce(), self._get_nonce()
-            verification_proof = self.get_verification_path_proof(0)
+            verification_proof = verification_proof_f.result()
 
         # construct preparation_proof
         pre_transfer_index_padded = self._pad_int(pre_transfer_index)
@@ -568,16 +795,17 @@ class ZkTransfer:
     @timing
     def _get_transfer_proof(self, commit_root, bitmap, addrs_padded, passhprase, threshold, nonce):
         assert(len(bitmap) == MAX_FRIENDS_LEN)
-        out = create_string_buffer(PROOF_BUF_LEN)
-        arr, bufs = self._bytes_list_to_carray(addrs_padded)
+        out = self._proof_bufs['transfer']
+        memset(out, 0, PROOF_BUF_LEN)
+        arr, bufs = self._buffer_to_carray(addrs_padded)
         self.librustzk._generate_transfer_proof(
-            self._to_cbuf(commit_root),
-            self._to_cbuf(bytes(bitmap)),
+            c_char_p(commit_root),
+            c_char_p(bytes(bitmap)),
             arr,
-            self._to_cbuf(passhprase),
-            self._to_cbuf(threshold),
-            self._to_cbuf(nonce),
-            self._to_cbuf(self.transfer_params),
+            c_char_p(passhprase),
+            c_char_p(threshold),
+            c_char_p(nonce),
+            c_char_p(self.transfer_params),
             c_int(len(self.transfer_params)),
             out, c_int(PROOF_BUF_LEN))
         return out.raw
@@ -604,12 +832,12 @@ class ZkTransfer:
         commit_root, commit_nonce = commit["commit_root"], commit["nonce"]
 
         # get extended friend list
-        extended_friends = self._extend_friends(
-            friends, passphrase, threshold, commit_nonce)
+        extended_friends, tree = self._extend_and_build_tree(
+            self._canonicalize_friends(tuple(friends)), passphrase, threshold, commit_nonce)
 
-        # construct transfer_proof
-        extended_friends_padded = [
-            self._pad_hexstr(f) for f in extended_friends]
+        # construct transfer_proof; the tree leaves already hold the
+        # padded addresses
+        extended_friends_padded = tree[FRIENDS_MERKLE_DEPTH]
         print("generating transfer proof...")
         transfer_proof = self._get_transfer_proof(
             commit_root, bitmap, extended_friends_padded,